@@ -1,5 +1,9 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from itertools import combinations
 import math
+from operator import add, mul
+import random
 
 def ask_int(prompt, cond=None, err_msg="Invalid input."):
     while True:
@@ -104,43 +108,32 @@ def parse_rectangles_bulk(block, expected_count=None):
     return rects
 
 def central_points_from_rects(departments):
-    cps = []
-    for x0, x1, y0, y1 in departments:
-        cx = (x0 + x1) / 2.0
-        cy = (y0 + y1) / 2.0
-        cps.append([cx, cy])
-    return cps
+    return [[(x0 + x1) * 0.5, (y0 + y1) * 0.5] for x0, x1, y0, y1 in departments]
+
+def mirror_upper(upper):
+    """
+    Full symmetric matrix with zero diagonal from its strict upper triangle,
+    given as ragged rows: upper[i] holds the entries j > i of row i.
+    Only n(n-1)/2 values are computed; the lower triangle is copied over.
+    """
+    M = []
+    for i, up in enumerate(upper):
+        M.append([row[i] for row in M] + [0.0] + up)
+    return M
 
 def manhattan_distance_matrix(points):
-    n = len(points)
-    D = zero_matrix(n)
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                D[i][j] = abs(points[i][0]-points[j][0]) + abs(points[i][1]-points[j][1])
-    return D
+    return mirror_upper([[abs(xi - xj) + abs(yi - yj) for xj, yj in points[i + 1:]]
+                         for i, (xi, yi) in enumerate(points)])
 
 def euclidean_distance_matrix(points):
-    n = len(points)
-    D = zero_matrix(n)
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                dx = points[i][0]-points[j][0]
-                dy = points[i][1]-points[j][1]
-                D[i][j] = math.hypot(dx, dy)
-    return D
+    hypot = math.hypot
+    return mirror_upper([[hypot(xi - xj, yi - yj) for xj, yj in points[i + 1:]]
+                         for i, (xi, yi) in enumerate(points)])
 
 def symmetrize_with_zero_diag(M):
-    n = len(M)
-    S = zero_matrix(n)
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                S[i][j] = 0.0
-            else:
-                S[i][j] = 0.5 * (M[i][j] + M[j][i])
-    return S
+    # pair row i with column i (zip(*M)) and average the entries right of the diagonal
+    return mirror_upper([[0.5 * (a + b) for a, b in zip(M_i[i + 1:], col[i + 1:])]
+                         for i, (M_i, col) in enumerate(zip(M, zip(*M)))])
 
 # =========================
 # CRAFT core
@@ -151,12 +144,12 @@ def compute_cost(F, D, C, perm):
     n = len(F)
     total = 0.0
     for i in range(n):
-        pi = perm[i]
+        # rows that stay fixed for the whole inner loop
+        F_i, C_i, D_pi = F[i], C[i], D[perm[i]]
         for j in range(n):
             if i == j:
                 continue
-            pj = perm[j]
-            total += F[i][j] * D[pi][pj] * C[i][j]
+            total += F_i[j] * D_pi[perm[j]] * C_i[j]
     return total
 
 def delta_swap(i, j, F, D, C, perm):
@@ -166,74 +159,326 @@ def delta_swap(i, j, F, D, C, perm):
     """
     if i == j:
         return 0.0
-    n = len(F)
     pi, pj = perm[i], perm[j]
+    # bind the rows touched by every k once; only rows k vary inside the loop
+    F_i, F_j, C_i, C_j = F[i], F[j], C[i], C[j]
+    D_pi, D_pj = D[pi], D[pj]
     dlt = 0.0
 
-    for k in range(n):
+    for k, (F_k, C_k, pk) in enumerate(zip(F, C, perm)):
         if k == i or k == j:
             continue
-        pk = perm[k]
+        D_pk = D[pk]
         # i with k
-        dlt += F[i][k] * (D[pj][pk] - D[pi][pk]) * C[i][k]
-        dlt += F[k][i] * (D[pk][pj] - D[pk][pi]) * C[k][i]
+        dlt += F_i[k] * (D_pj[pk] - D_pi[pk]) * C_i[k]
+        dlt += F_k[i] * (D_pk[pj] - D_pk[pi]) * C_k[i]
         # j with k
-        dlt += F[j][k] * (D[pi][pk] - D[pj][pk]) * C[j][k]
-        dlt += F[k][j] * (D[pk][pi] - D[pk][pj]) * C[k][j]
+        dlt += F_j[k] * (D_pi[pk] - D_pj[pk]) * C_j[k]
+        dlt += F_k[j] * (D_pk[pi] - D_pk[pj]) * C_k[j]
 
     # i with j
-    dlt += F[i][j] * (D[pj][pi] - D[pi][pj]) * C[i][j]
-    dlt += F[j][i] * (D[pi][pj] - D[pj][pi]) * C[j][i]
+    dlt += F_i[j] * (D_pj[pi] - D_pi[pj]) * C_i[j]
+    dlt += F_j[i] * (D_pi[pj] - D_pj[pi]) * C_j[i]
     return dlt
 
+def weight_matrix(F, C):
+    """A[i][j] = F[i][j] * C[i][j]: flow and handling cost never change during a search."""
+    return [list(map(mul, F_i, C_i)) for F_i, C_i in zip(F, C)]
+
+def permuted_distance_matrix(D, perm):
+    """Q[i][k] = D[perm[i]][perm[k]]: distances indexed by department, not location."""
+    return [[D_pi[pk] for pk in perm] for D_pi in (D[pi] for pi in perm)]
+
+def permuted_cost(A, Q):
+    """Cost from per-pair weights A = F*C and Q = permuted_distance_matrix(D, perm)."""
+    # Q already holds the gathered distances, so each row is a plain dot product
+    return sum(sum(map(mul, A_i, Q_i)) - A_i[i] * Q_i[i] for i, (A_i, Q_i) in enumerate(zip(A, Q)))
+
+def swap_departments(Q, i, j):
+    """Update a permuted_distance_matrix in place after departments i and j swap locations."""
+    Q[i], Q[j] = Q[j], Q[i]
+    for row in Q:
+        row[i], row[j] = row[j], row[i]
+
+# Largest n for which delta_swap_sym uses a generated, fully unrolled kernel
+UNROLL_MAX_N = 64
+
+@lru_cache(maxsize=None)
+def unrolled_row_delta(n):
+    """
+    Kernel for sum_k (W_i[k] - W_j[k]) * (Q_j[k] - Q_i[k]) with the n terms
+    written out in generated source, so a call runs no loop or iterator.
+    Built once per problem size. Terms are added left to right, the same
+    order as the plain loop delta_swap_sym falls back to for larger n.
+    """
+    terms = " + ".join(f"(W_i[{k}] - W_j[{k}]) * (Q_j[{k}] - Q_i[{k}])" for k in range(n))
+    src = f"def row_delta_{n}(W_i, W_j, Q_i, Q_j):\n    return {terms or '0.0'}\n"
+    namespace = {}
+    exec(src, namespace)
+    return namespace[f"row_delta_{n}"]
+
+def delta_swap_sym(i, j, W, Q):
+    """
+    delta_swap for a symmetric distance matrix, with W = F*C + (F*C)^T and
+    Q = permuted_distance_matrix(D, perm). Both flow directions between i
+    (or j) and k collapse into one term and the i-j terms cancel, so this is
+    a single pass over the rows W[i], W[j], Q[i], Q[j].
+    Called with (F*C, Q) and ((F*C)^T, Q^T) it gives the two one-sided halves
+    of the asymmetric delta.
+    """
+    if i == j:
+        return 0.0
+    W_i, W_j, Q_i, Q_j = W[i], W[j], Q[i], Q[j]
+    n = len(W_i)
+    if n <= UNROLL_MAX_N:
+        dlt = unrolled_row_delta(n)(W_i, W_j, Q_i, Q_j)
+    else:
+        # plain left-to-right loop, not sum(): from Python 3.12 sum() of floats
+        # is compensated and would no longer match the unrolled kernel
+        dlt = 0.0
+        for wi, wj, qi, qj in zip(W_i, W_j, Q_i, Q_j):
+            dlt += (wi - wj) * (qj - qi)
+    # k == i and k == j were included above; take their terms back out
+    dlt -= (W_i[i] - W_j[i]) * (Q_j[i] - Q_i[i])
+    dlt -= (W_i[j] - W_j[j]) * (Q_j[j] - Q_i[j])
+    return dlt
+
+def is_symmetric(M):
+    return all(M[i][j] == M[j][i] for i in range(len(M)) for j in range(i + 1, len(M)))
+
+def transpose(M):
+    return [list(col) for col in zip(*M)]
+
+def update_deltas_after_swap(delta, u, v, pair_delta, terms, free):
+    """
+    Refresh the cached swap deltas after departments u and v were swapped
+    (the permuted distance matrices must already reflect the swap).
+    terms is [(W, Q)] for a symmetric D, else [(FC, Q), (FC^T, Q^T)];
+    pair_delta(r, s) gives the O(n) delta of a single pair.
+    Pairs touching u or v are recomputed in O(n); every other pair is
+    corrected in O(1) (Taillard's update), so a refresh is O(n^2) not O(n^3).
+    """
+    for A, Q in terms:
+        # per-department parts of the O(1) correction, read once per column
+        a_col = [A_k[v] - A_k[u] for A_k in A]
+        q_col = [Q_k[u] - Q_k[v] for Q_k in Q]
+        for a, r in enumerate(free):
+            cr, qr = -a_col[r], -q_col[r]
+            row = delta[r]
+            # pairs touching u or v get garbage here and are overwritten below
+            for s in free[a + 1:]:
+                row[s] += (cr + a_col[s]) * (q_col[s] + qr)
+
+    for k in free:
+        for m in (u, v):
+            if k != u and k != v:
+                lo, hi = (k, m) if k < m else (m, k)
+                delta[lo][hi] = pair_delta(lo, hi)
+    lo, hi = (u, v) if u < v else (v, u)
+    delta[lo][hi] = pair_delta(lo, hi)
+
+def full_delta_matrix(n, free, pair_delta):
+    """
+    n x n delta cache: delta[i][j] = pair_delta(i, j) for i < j with both
+    departments free. Entries outside that upper triangle stay 0.0 and are
+    never read.
+    """
+    delta = zero_matrix(n)
+    for a, i in enumerate(free):
+        row = delta[i]
+        for j in free[a + 1:]:
+            row[j] = pair_delta(i, j)
+    return delta
+
+def init_swap_search(F, D, C, perm, free):
+    """
+    Shared setup for the swap searches. Returns (cost, delta, terms, pair_delta):
+    delta[i][j] (i < j, both in free) is the cost change of swapping i and j,
+    terms / pair_delta are what update_deltas_after_swap needs.
+    A symmetric D (e.g. after symmetrize_with_zero_diag) uses delta_swap_sym
+    with W = F*C + (F*C)^T; otherwise both one-sided halves are kept.
+    """
+    n = len(F)
+    FC = weight_matrix(F, C)
+    # distances in department order, so the kernels never index through perm
+    Q = permuted_distance_matrix(D, perm)
+    cost = permuted_cost(FC, Q)
+
+    if is_symmetric(D):
+        W = [list(map(add, FC_i, FC_col)) for FC_i, FC_col in zip(FC, zip(*FC))]
+        terms = [(W, Q)]
+        pair_delta = lambda r, s: delta_swap_sym(r, s, W, Q)
+    else:
+        FCT, QT = transpose(FC), transpose(Q)
+        terms = [(FC, Q), (FCT, QT)]
+        pair_delta = lambda r, s: (delta_swap_sym(r, s, FC, Q) + delta_swap_sym(r, s, FCT, QT)
+                                   + (FC[r][s] - FC[s][r]) * (Q[s][r] - Q[r][s]))
+
+    return cost, full_delta_matrix(n, free, pair_delta), terms, pair_delta
+
+def apply_swap(i, j, perm, delta, terms, pair_delta, free):
+    """Swap departments i and j and bring the permuted distances and delta cache up to date."""
+    perm[i], perm[j] = perm[j], perm[i]
+    for _, Q in terms:
+        swap_departments(Q, i, j)
+    update_deltas_after_swap(delta, i, j, pair_delta, terms, free)
+
+def best_improving_swap(delta, free):
+    """
+    (best_delta, (i, j)) for the most negative cached delta, or (0.0, None)
+    if no swap strictly improves. Ties go to the first pair in row order.
+    Each row is scanned with the min builtin; only a winning row is searched
+    for its column.
+    """
+    best_delta = 0.0
+    best_pair = None
+    for a, i in enumerate(free):
+        cols = free[a + 1:]
+        if not cols:
+            break
+        vals = list(map(delta[i].__getitem__, cols))
+        m = min(vals)
+        if m < best_delta:  # strictly improving
+            best_delta = m
+            best_pair = (i, cols[vals.index(m)])
+    return best_delta, best_pair
+
 def craft_local_search(F, D, C, department_labels, initial_perm=None, verbose=False, fixed_indices=None, max_passes=10_000):
     """
     Greedy pairwise-swap descent until no improving swap remains.
     fixed_indices: set of department indices that must not move.
+    Swap deltas are cached in delta[i][j] (i < j) and refreshed after each
+    accepted swap instead of being rescanned from scratch.
     Returns (best_perm, best_cost, history)
     """
     n = len(F)
     perm = list(range(n)) if initial_perm is None else initial_perm[:]
     fixed = set(fixed_indices or [])
-    best_cost = compute_cost(F, D, C, perm)
+    free = [k for k in range(n) if k not in fixed]
+    best_cost, delta, terms, pair_delta = init_swap_search(F, D, C, perm, free)
     history = [("Initial", best_cost)]
 
     passes = 0
     while passes < max_passes:
         passes += 1
-        improved = False
-        best_delta = 0.0
-        best_pair = None
-
-        for i in range(n - 1):
-            if i in fixed: 
-                continue
-            for j in range(i + 1, n):
-                if j in fixed:
-                    continue
-                d = delta_swap(i, j, F, D, C, perm)
-                if d < best_delta:  # strictly improving
-                    best_delta = d
-                    best_pair = (i, j)
-
+        best_delta, best_pair = best_improving_swap(delta, free)
         if best_pair is None:
             break  # local optimum reached
 
         # apply best swap
         i, j = best_pair
-        perm[i], perm[j] = perm[j], perm[i]
+        apply_swap(i, j, perm, delta, terms, pair_delta, free)
         best_cost += best_delta
         label_i, label_j = department_labels[i], department_labels[j]
         history.append((f"Swap {label_i} ↔ {label_j}", best_cost))
-        improved = True
         if verbose:
             print(f"Swap {label_i} ↔ {label_j} | Δ={best_delta:.4f} | Cost={best_cost:.4f}")
 
-        if not improved:
-            break
-
     return perm, best_cost, history
 
+def craft_tabu(F, D, C, department_labels, initial_perm=None, verbose=False, fixed_indices=None,
+               tabu_tenure=7, max_iters=5000):
+    """
+    Tabu search over pairwise swaps, using the same delta cache as
+    craft_local_search. Every iteration makes the best non-tabu swap, even a
+    worsening one, so the search can climb out of local optima. A swapped
+    pair stays tabu for tabu_tenure iterations unless it would beat the best
+    cost found so far (aspiration). A new best is confirmed with compute_cost
+    before it is recorded.
+    Returns (best_perm, best_cost, history); history lists each new best.
+    """
+    n = len(F)
+    perm = list(range(n)) if initial_perm is None else initial_perm[:]
+    fixed = set(fixed_indices or [])
+    free = [k for k in range(n) if k not in fixed]
+    cost, delta, terms, pair_delta = init_swap_search(F, D, C, perm, free)
+    best_perm, best_cost = perm[:], cost
+    history = [("Initial", best_cost)]
+    tabu_until = [[0]*n for _ in range(n)]
+
+    for it in range(1, max_iters + 1):
+        # cost is a running sum of cached deltas that drift under repeated
+        # updates, so only a gain clearly above rounding counts as a new best
+        eps = 1e-9 * max(1.0, abs(best_cost))
+        aspiration = best_cost - cost - eps  # any delta below this is a new best
+        move_delta = math.inf
+        move = None
+
+        for a, i in enumerate(free):
+            row, tabu_row = delta[i], tabu_until[i]
+            for j in free[a + 1:]:
+                d = row[j]
+                if d < move_delta and (tabu_row[j] < it or d < aspiration):
+                    move_delta = d
+                    move = (i, j)
+
+        if move is None:
+            break  # every pair is tabu
+
+        i, j = move
+        apply_swap(i, j, perm, delta, terms, pair_delta, free)
+        cost += move_delta
+        tabu_until[i][j] = it + tabu_tenure
+        label_i, label_j = department_labels[i], department_labels[j]
+        if verbose:
+            print(f"Iter {it}: Swap {label_i} ↔ {label_j} | Δ={move_delta:.4f} | Cost={cost:.4f}")
+
+        if cost < best_cost - eps:
+            # re-evaluate exactly, so drift can neither fake a new best nor leak into best_cost
+            cost = compute_cost(F, D, C, perm)
+            if cost < best_cost - eps:
+                best_perm, best_cost = perm[:], cost
+                history.append((f"Iter {it}: Swap {label_i} ↔ {label_j}", best_cost))
+
+    return best_perm, best_cost, history
+
+def random_start_perms(initial_perm, starts, fixed_indices=None, seed=None):
+    """
+    initial_perm followed by starts-1 random layouts. Only the locations held
+    by non-fixed departments are shuffled, so fixed departments stay put.
+    """
+    rng = random.Random(seed)
+    fixed = set(fixed_indices or [])
+    free = [k for k in range(len(initial_perm)) if k not in fixed]
+    perms = [initial_perm[:]]
+    for _ in range(starts - 1):
+        locs = [initial_perm[k] for k in free]
+        rng.shuffle(locs)
+        perm = initial_perm[:]
+        for k, loc in zip(free, locs):
+            perm[k] = loc
+        perms.append(perm)
+    return perms
+
+def craft_multistart(F, D, C, department_labels, starts=64, workers=None, seed=None,
+                     initial_perm=None, fixed_indices=None, search=None, **search_kwargs):
+    """
+    Runs a swap search (craft_local_search by default, or e.g. craft_tabu)
+    from `starts` layouts (see random_start_perms) in parallel processes and
+    keeps the cheapest result. Extra keyword arguments go to the search.
+    workers=None uses every CPU; workers=1 runs the starts in this process.
+    Returns (best_perm, best_cost, history) of the winning run.
+    """
+    search = search or craft_local_search
+    n = len(F)
+    base = list(range(n)) if initial_perm is None else initial_perm[:]
+    perms = random_start_perms(base, starts, fixed_indices, seed)
+
+    if workers == 1 or len(perms) == 1:
+        results = [search(F, D, C, department_labels, initial_perm=p,
+                          fixed_indices=fixed_indices, **search_kwargs)
+                   for p in perms]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(search, F, D, C, department_labels,
+                                   initial_perm=p, fixed_indices=fixed_indices,
+                                   **search_kwargs)
+                       for p in perms]
+            results = [f.result() for f in futures]
+
+    # min() keeps the first of equal costs, so ties go to initial_perm
+    return min(results, key=lambda r: r[1])
+
 # =========================
 # Program entry (interactive)
 # =========================
@@ -330,6 +575,23 @@ def main():
             else:
                 print(f"Warning: unknown label '{lab}' ignored.")
 
+    # ---------- Search method & restarts ----------
+    print("\nChoose search method:")
+    print("1) Greedy descent (classic CRAFT, stops at the first local optimum)")
+    print("2) Tabu search (also accepts worsening swaps to escape local optima)")
+    method = ask_int("Enter 1 or 2: ", cond=lambda x: x in (1,2), err_msg="Please enter 1 or 2.")
+    if method == 1:
+        search, search_kwargs = craft_local_search, {}
+    else:
+        tenure = ask_int("Tabu tenure (iterations a swapped pair stays forbidden, e.g. 7): ",
+                         cond=lambda x: x >= 1, err_msg="Must be at least 1.")
+        iters = ask_int("Number of tabu iterations (e.g. 5000): ",
+                        cond=lambda x: x >= 1, err_msg="Must be at least 1.")
+        search, search_kwargs = craft_tabu, {"tabu_tenure": tenure, "max_iters": iters}
+
+    restarts = ask_int("\nNumber of random restarts (1 = single run from the identity layout): ",
+                       cond=lambda x: x >= 1, err_msg="Must be at least 1.")
+
     # ---------- Initial cost ----------
     n = a
     initial_perm = list(range(n))  # dept i at location i
@@ -338,13 +600,27 @@ def main():
     print(f"\nOriginal Total Cost (identity assignment): {original_cost:.4f}")
 
     # ---------- Run CRAFT local search ----------
-    best_perm, best_cost, history = craft_local_search(
-        flow_matrix, distance_matrix, handling_cost,
-        department_labels=department_labels,
-        initial_perm=initial_perm,
-        verbose=verbose,
-        fixed_indices=fixed_indices
-    )
+    if restarts == 1:
+        best_perm, best_cost, history = search(
+            flow_matrix, distance_matrix, handling_cost,
+            department_labels=department_labels,
+            initial_perm=initial_perm,
+            verbose=verbose,
+            fixed_indices=fixed_indices,
+            **search_kwargs
+        )
+    else:
+        if verbose:
+            print("Note: verbose swap logs are not shown for parallel restarts.")
+        best_perm, best_cost, history = craft_multistart(
+            flow_matrix, distance_matrix, handling_cost,
+            department_labels=department_labels,
+            starts=restarts,
+            initial_perm=initial_perm,
+            fixed_indices=fixed_indices,
+            search=search,
+            **search_kwargs
+        )
 
     # ---------- Report ----------
     savings = original_cost - best_cost